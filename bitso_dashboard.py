@@ -1,27 +1,98 @@
+import io
+import os
+
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 import numpy as np
 import requests
 
-# Load trade log
+# Trade log columns as the bot writes them; the dashboard only uses the first five
+CSV_COLUMNS = ["timestamp", "side", "price", "amount", "order_id", "usd_value", "mxn_value"]
+USED_COLUMNS = ["timestamp", "side", "price", "amount", "order_id"]
+
+def _clean_trades(df):
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
+    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+    df = df.dropna(subset=['amount', 'price', 'timestamp'])
+    df['notional'] = df['amount'].to_numpy() * df['price'].to_numpy()
+    return df
+
 @st.cache_data(ttl=60)
-def load_data():
+def _load_parquet():
+    # Parquet already stores real dtypes, so no text parsing or coercion
+    df = pd.read_parquet("bitso_trades.parquet", columns=USED_COLUMNS)
+    df['side'] = df['side'].astype('category')
+    df = df.dropna(subset=['amount', 'price', 'timestamp'])
+    df['notional'] = df['amount'].to_numpy() * df['price'].to_numpy()
+    return df.sort_values('timestamp').reset_index(drop=True)
+
+def _load_csv_incremental():
+    # The log is append-only, so keep (byte offset, cleaned frame) in session
+    # state and parse only the suffix written since the last rerun. A file
+    # shorter than the remembered offset means rotation: start over.
     try:
-        return pd.read_csv("bitso_trades.csv", parse_dates=['timestamp'])
-    except FileNotFoundError:
-        return pd.DataFrame(columns=["timestamp", "side", "price", "amount", "order_id", "usd_value", "mxn_value"])
+        size = os.path.getsize("bitso_trades.csv")
+    except OSError:
+        return pd.DataFrame(columns=USED_COLUMNS + ["notional"])
+    offset, df = st.session_state.get('trades_cache', (0, None))
+    if size < offset:
+        offset, df = 0, None
+    if size == offset and df is not None:
+        return df
+    with open("bitso_trades.csv", "rb") as f:
+        f.seek(offset)
+        buf = f.read()
+    # A refresh can land while the bot is mid-append: consume only up to the
+    # last complete line and leave any partial row for the next refresh
+    consumed = buf.rfind(b'\n') + 1
+    buf = buf[:consumed]
+    if not buf:
+        return df if df is not None else pd.DataFrame(columns=USED_COLUMNS + ["notional"])
+    kwargs = dict(usecols=USED_COLUMNS,
+                  dtype={'side': 'category', 'order_id': 'string', 'amount': 'float64', 'price': 'float64'},
+                  parse_dates=['timestamp'], engine='c')
+    if offset == 0:
+        new = pd.read_csv(io.BytesIO(buf), **kwargs)
+    else:
+        new = pd.read_csv(io.BytesIO(buf), header=None, names=CSV_COLUMNS, **kwargs)
+    df = _clean_trades(new) if df is None else pd.concat([df, _clean_trades(new)], ignore_index=True)
+    df['side'] = df['side'].astype('category')
+    # Appends are usually already in timestamp order; only pay for a sort when not
+    if not df['timestamp'].is_monotonic_increasing:
+        df = df.sort_values('timestamp')
+    df = df.reset_index(drop=True)
+    st.session_state['trades_cache'] = (offset + consumed, df)
+    return df
+
+# Load trade log: prefer the columnar Parquet copy of the log when the bot has
+# written one (no text parsing, dtypes preserved), else tail-read the CSV
+def load_data():
+    if os.path.exists("bitso_trades.parquet"):
+        return _load_parquet()
+    return _load_csv_incremental()
+
+# Chart aggregations, keyed on a cheap (row count, last timestamp) signature so
+# Streamlit hashes a tuple instead of the whole DataFrame on every rerun
+@st.cache_data(ttl=60)
+def hourly_volume(df_sig, _df):
+    # Long form, ready for Altair: no unstack/melt round trip
+    return (_df.groupby([pd.Grouper(key='timestamp', freq='h'), 'side'], observed=True, as_index=False)['amount']
+            .sum()
+            .rename(columns={'side': 'Side', 'amount': 'Amount'}))
+
+@st.cache_data(ttl=60)
+def hourly_price(df_sig, _df):
+    return _df.set_index('timestamp')['price'].resample('h').mean().reset_index()
+
+@st.cache_data(ttl=60)
+def hourly_bars(df_sig, _df):
+    # Hour-of-day as an inline grouping key: no extra column written to the frame
+    return (_df.groupby([_df['timestamp'].dt.hour.rename('hour'), 'side'], observed=True)['amount']
+            .sum().unstack().fillna(0).round(2))
 
 # Load and process data
 data = load_data()
-if 'usd_value' not in data.columns:
-    data['usd_value'] = data.apply(lambda row: row['amount'] / cost_basis if row['side'] == 'sell' else row['amount'], axis=1)
-if 'mxn_value' not in data.columns:
-    data['mxn_value'] = data.apply(lambda row: row['amount'] * cost_basis if row['side'] == 'buy' else row['amount'], axis=1)
-data['timestamp'] = pd.to_datetime(data['timestamp'])
-data['amount'] = pd.to_numeric(data['amount'], errors='coerce')
-data['price'] = pd.to_numeric(data['price'], errors='coerce')
-data = data.dropna()
 
 # Dashboard controls
 st.sidebar.title("Trading Controls")
@@ -56,32 +127,46 @@ elif bot_mode == "Position Exit Bot":
     execution_interval = st.sidebar.slider("Execution Interval (minutes)", min_value=5, max_value=120, value=60, step=5)
 st.sidebar.caption(f"Entered: **${block_size:,.2f} MXN**")
 
-# Exposure logic
-sell_mxn = data[data['side'] == 'sell']['amount'].sum()
-buy_usd = (data[data['side'] == 'buy']['amount'] * data[data['side'] == 'buy']['price']).sum()
+# Exposure logic: every per-side metric comes out of one aggregation pass;
+# reindexing guarantees both rows exist even when a side has no trades yet
+side_agg = (data.groupby('side', observed=True, sort=False)
+            .agg(amount_sum=('amount', 'sum'), price_mean=('price', 'mean'), notional_sum=('notional', 'sum'))
+            .reindex(['sell', 'buy'])
+            .fillna({'amount_sum': 0.0, 'notional_sum': 0.0}))
+sell_mxn = side_agg.at['sell', 'amount_sum']
+buy_usd = side_agg.at['buy', 'notional_sum']
+buy_avg = side_agg.at['buy', 'price_mean']
+sell_avg = side_agg.at['sell', 'price_mean']
+sell_qty = side_agg.at['sell', 'amount_sum']
+# Computed once up front: the bot-mode branches below read these before the
+# cost-basis section renders them
+sell_price_deviation = 0.0 if np.isnan(sell_avg) else sell_avg - cost_basis
+buy_price_deviation = 0.0 if np.isnan(buy_avg) else cost_basis - buy_avg
+
+# Progress toward daily target: batch the threshold math in one NumPy block so
+# adding a metric is one more row, not another branchy scalar stanza
+fulfillment_labels = (("Sell MXN", "MXN"), ("Sell USD", "USD"))
+fulfillment_vals = np.array([sell_mxn, buy_usd])
+fulfillment_lims = np.array([mxn_exposure_limit, usd_exposure_limit])
+fulfillment_tgts = np.array([target_sell_mxn, target_sell_usd])
+fulfillment_progress = np.minimum(fulfillment_vals / np.where(fulfillment_tgts > 0, fulfillment_tgts, 1), 1.0)
+hit_limit = fulfillment_vals >= fulfillment_lims
+hit_target = fulfillment_vals >= fulfillment_tgts
 
-# Progress toward daily target
 st.sidebar.markdown("### 📈 Trade Fulfillment")
-sell_progress = min(sell_mxn / target_sell_mxn, 1.0)
-buy_progress = min(buy_usd / target_sell_usd, 1.0)
-sell_color = 'green' if sell_progress >= 0.8 else 'orange' if sell_progress >= 0.5 else 'red'
-st.sidebar.markdown(f"<span style='color:{sell_color}; font-weight:bold;'>Sell MXN Progress: ${sell_mxn:,.0f} / ${target_sell_mxn:,.0f} MXN</span>", unsafe_allow_html=True)
-st.sidebar.progress(sell_progress)
-buy_color = 'green' if buy_progress >= 0.8 else 'orange' if buy_progress >= 0.5 else 'red'
-st.sidebar.markdown(f"<span style='color:{buy_color}; font-weight:bold;'>Sell USD Progress: ${buy_usd:,.0f} / ${target_sell_usd:,.0f} USD</span>", unsafe_allow_html=True)
-st.sidebar.progress(buy_progress)
+for (label, ccy), val, tgt, prog in zip(fulfillment_labels, fulfillment_vals, fulfillment_tgts, fulfillment_progress):
+    color = 'green' if prog >= 0.8 else 'orange' if prog >= 0.5 else 'red'
+    st.sidebar.markdown(f"<span style='color:{color}; font-weight:bold;'>{label} Progress: ${val:,.0f} / ${tgt:,.0f} {ccy}</span>", unsafe_allow_html=True)
+    st.sidebar.progress(float(prog))
 
 
 
 # Alerts
-if sell_mxn >= mxn_exposure_limit:
-    st.warning(f"⚠️ MXN exposure limit reached: ${sell_mxn:,.2f} / ${mxn_exposure_limit:,.2f} MXN")
-if buy_usd >= usd_exposure_limit:
-    st.warning(f"⚠️ USD exposure limit reached: ${buy_usd:,.2f} / ${usd_exposure_limit:,.2f} USD")
-if sell_mxn >= target_sell_mxn:
-    st.success(f"✅ Target Sell MXN achieved: ${sell_mxn:,.2f} / ${target_sell_mxn:,.2f} MXN")
-if buy_usd >= target_sell_usd:
-    st.success(f"✅ Target Sell USD achieved: ${buy_usd:,.2f} / ${target_sell_usd:,.2f} USD")
+for (label, ccy), val, lim, tgt, over_lim, over_tgt in zip(fulfillment_labels, fulfillment_vals, fulfillment_lims, fulfillment_tgts, hit_limit, hit_target):
+    if over_lim:
+        st.warning(f"⚠️ {ccy} exposure limit reached: ${val:,.2f} / ${lim:,.2f} {ccy}")
+    if over_tgt:
+        st.success(f"✅ Target {label} achieved: ${val:,.2f} / ${tgt:,.2f} {ccy}")
 
 # Bitso balance fetch (mocked API call)
 st.subheader("📡 Bitso Account Balances (demo)")
@@ -94,8 +179,8 @@ st.metric("Available USD", f"${balances['USD']:,.2f} USD")
 
 # Volatility monitoring
 st.subheader("📉 Volatility Monitor")
-data['rolling_vol'] = data['price'].rolling(window=10).std()
-latest_vol = data['rolling_vol'].iloc[-1] if not data['rolling_vol'].isna().all() else 0.0
+vol_tail = data['price'].to_numpy()[-10:]
+latest_vol = float(vol_tail.std(ddof=1)) if vol_tail.size >= 2 else 0.0
 st.metric("Recent Volatility (10 trades)", f"{latest_vol:.6f}")
 
 # Recommended action
@@ -133,19 +218,13 @@ else:
 
 # Cost basis analysis
 st.subheader("📉 Trade vs. Cost Basis Analysis")
-buy_avg = data[data['side'] == 'buy']['price'].mean()
-sell_avg = data[data['side'] == 'sell']['price'].mean()
-sell_qty = data[data['side'] == 'sell']['amount'].sum()
-
 st.metric("Cost Basis (USD/MXN)", f"{cost_basis:.4f}")
-sell_price_deviation = sell_avg - cost_basis if not np.isnan(sell_avg) else 0.0
 st.metric("Avg Sell vs. Cost Basis", f"{sell_price_deviation:.4f}")
-buy_price_deviation = cost_basis - buy_avg if not np.isnan(buy_avg) else 0.0
 st.metric("Avg Buy vs. Cost Basis", f"{buy_price_deviation:.4f}")
 
 # Profit/loss using cost basis
 cost_basis_pnl = (sell_avg - cost_basis) * sell_qty if not np.isnan(sell_avg) else 0.0
-cost_basis_buy_pnl = (cost_basis - buy_avg) * data[data['side'] == 'buy']['amount'].sum() if not np.isnan(buy_avg) else 0.0
+cost_basis_buy_pnl = (cost_basis - buy_avg) * side_agg.at['buy', 'amount_sum'] if not np.isnan(buy_avg) else 0.0
 sell_pnl_color = 'green' if cost_basis_pnl >= 0 else 'red'
 st.metric("Est. Sell P&L vs. Cost Basis", f"${cost_basis_pnl:,.2f} MXN", delta=f"${cost_basis_pnl:,.2f}", delta_color=sell_pnl_color)
 buy_pnl_color = 'green' if cost_basis_buy_pnl >= 0 else 'red'
@@ -166,32 +245,54 @@ st.metric("Total Sell USD", f"${buy_usd:,.2f} USD")
 mxn_value_of_usd_buys = buy_usd * cost_basis
 st.metric("MXN Value of USD Buys", f"${mxn_value_of_usd_buys:,.2f} MXN")
 
-# Trade log chart
-st.subheader("Trade Volume Over Time")
+# Trade log chart: fragments, so sidebar widgets that only affect alerts and
+# text rerun without dragging the chart pipeline along
 import altair as alt
-volume_chart_reset = volume_chart.reset_index().melt(id_vars='timestamp', var_name='Side', value_name='Amount')
-line_chart = alt.Chart(volume_chart_reset).mark_line().encode(
-    x='timestamp:T',
-    y=alt.Y('Amount:Q', title='Trade Volume'),
-    color='Side:N',
-    tooltip=['timestamp:T', 'Side:N', 'Amount:Q']
-).interactive()
-
-price_overlay = data['price'].resample('H').mean().reset_index()
-price_line = alt.Chart(price_overlay).mark_line(color='gray', strokeDash=[5, 5]).encode(
-    x='timestamp:T',
-    y=alt.Y('price:Q', axis=alt.Axis(title='USD/MXN Rate'), scale=alt.Scale(zero=False)),
-    tooltip=['timestamp:T', alt.Tooltip('price:Q', format='.4f')]
-)
 
-st.altair_chart((line_chart + price_line).resolve_scale(y='independent').properties(height=400), use_container_width=True)
+# The spec only depends on the aggregated frames, so reuse the built chart
+# object across reruns with the same aggregation signature
+@st.cache_resource
+def build_volume_chart(chart_sig, _volume_long, _price_overlay):
+    line_chart = alt.Chart(_volume_long).mark_line().encode(
+        x='timestamp:T',
+        y=alt.Y('Amount:Q', title='Trade Volume'),
+        color='Side:N',
+        tooltip=['timestamp:T', 'Side:N', 'Amount:Q']
+    ).interactive()
+
+    price_line = alt.Chart(_price_overlay).mark_line(color='gray', strokeDash=[5, 5]).encode(
+        x='timestamp:T',
+        y=alt.Y('price:Q', axis=alt.Axis(title='USD/MXN Rate'), scale=alt.Scale(zero=False)),
+        tooltip=['timestamp:T', alt.Tooltip('price:Q', format='.4f')]
+    )
 
-# Hourly analysis
-st.subheader("📅 Hourly Execution Overview")
-data['hour'] = data['timestamp'].dt.hour
-hourly = data.groupby(['hour', 'side'])['amount'].sum().unstack().fillna(0)
-hourly = hourly.applymap(lambda x: round(x, 2))
-st.bar_chart(hourly)
+    return (line_chart + price_line).resolve_scale(y='independent').properties(height=400)
+
+@st.fragment
+def render_volume_chart(recent, chart_sig):
+    st.subheader("Trade Volume Over Time")
+    volume_long = hourly_volume(chart_sig, recent)
+    price_overlay = hourly_price(chart_sig, recent)
+    st.altair_chart(build_volume_chart(chart_sig, volume_long, price_overlay), use_container_width=True)
+
+@st.fragment
+def render_hourly(recent, chart_sig):
+    st.subheader("📅 Hourly Execution Overview")
+    hourly = hourly_bars(chart_sig, recent)
+    st.bar_chart(hourly)
+
+# Charts only cover the recent window; the totals above stay all-history.
+# An empty log (missing or header-only file) has no window to chart at all
+if data.empty:
+    st.info("No trades logged yet. Charts will appear once the bot records activity.")
+else:
+    cutoff = data['timestamp'].max() - pd.Timedelta(hours=24)
+    recent = data[data['timestamp'] >= cutoff]
+    chart_sig = (len(recent), recent['timestamp'].iat[-1])
+    render_volume_chart(recent, chart_sig)
+
+    # Hourly analysis
+    render_hourly(recent, chart_sig)
 
 # Bot Activity Log (demo)
 st.subheader("📝 Recent Bot Decisions (Demo)")
@@ -203,9 +304,15 @@ bot_logs = [
 st.table(pd.DataFrame(bot_logs))
 
 # Show raw log
-data.reset_index(inplace=True)
 st.subheader("Recent Trades")
-styled_data = data.sort_values("timestamp", ascending=False).copy()
-styled_data["price"] = styled_data["price"].map("{:,.4f}".format)
-styled_data["amount"] = styled_data["amount"].map("{:,.2f}".format)
-st.dataframe(styled_data)
+# Only the newest 500 rows go over the wire; the full history stays server-side.
+# Formatting is delegated to the frontend so the columns stay float64
+st.dataframe(
+    data.iloc[::-1].head(500),
+    use_container_width=True,
+    column_config={
+        "price": st.column_config.NumberColumn(format="%.4f"),
+        "amount": st.column_config.NumberColumn(format="%.2f"),
+        "notional": st.column_config.NumberColumn(format="%.2f"),
+    },
+)